@@ -1,25 +1,56 @@
-from datetime import timedelta, datetime
+from datetime import timedelta
+from threading import Lock
+import hashlib
 import os
+import time
 
+from cachetools import TTLCache
 from fastapi import HTTPException
 import jwt
 
 
 algo = os.environ['ALGORITHM']
 secret_key = os.environ['SECRET_KEY']
+# Ключ кодируется один раз, чтобы pyjwt не делал этого на каждый вызов
+secret_key_bytes = secret_key.encode()
 token_lifetime = int(os.environ['TOKEN_LIFETIME'])
+default_ttl = token_lifetime * 60
+token_cache_size = int(os.environ.get('TOKEN_CACHE_SIZE', 10_000))
+token_cache_ttl = int(os.environ.get('TOKEN_CACHE_TTL', 60))
+
+# Общий экземпляр PyJWT с заранее заданными опциями и списком алгоритмов
+_jwt = jwt.PyJWT(options={"verify_exp": True})
+_algos = [algo]
+
+
+# Проверка подписи выполняется один раз на токен, дальше берем payload из кэша.
+# Ключ кэша - короткий blake2b-хэш токена, чтобы не хранить сами токены.
+_token_cache = TTLCache(maxsize=token_cache_size, ttl=token_cache_ttl)
+_token_cache_lock = Lock()
+
+
+def _decode_cached(token: str) -> dict:
+    key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    with _token_cache_lock:
+        payload = _token_cache.get(key)
+    if payload is None:
+        # Невалидный токен бросает исключение и в кэш не попадает
+        payload = _jwt.decode(token, secret_key_bytes, algorithms=_algos)
+        with _token_cache_lock:
+            _token_cache[key] = payload
+    elif payload["exp"] <= time.time():
+        # Для закэшированного токена проверяем только срок действия
+        with _token_cache_lock:
+            _token_cache.pop(key, None)
+        raise jwt.ExpiredSignatureError("Signature has expired")
+    return payload
 
 
 # Валидация JWT
 def validate_jwt(token: str):
     # Декодировать токен
     try:
-        payload = jwt.decode(
-            token,
-            secret_key,
-            algorithms=[algo],
-            options={"verify_exp": True},
-        )
+        payload = _decode_cached(token)
         return payload
     except jwt.ExpiredSignatureError as e:
         raise HTTPException(status_code=401, detail="Token expired") from e
@@ -31,17 +62,15 @@ def validate_jwt(token: str):
 def create_jwt(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        ttl = int(expires_delta.total_seconds())
     else:
-        expire = datetime.utcnow() + timedelta(minutes=token_lifetime)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, secret_key, algorithm=algo)
+        ttl = default_ttl
+    to_encode["exp"] = int(time.time()) + ttl
+    encoded_jwt = _jwt.encode(to_encode, secret_key_bytes, algorithm=algo)
     return encoded_jwt
 
 
 def get_user_from_token(token: str):
-    payload = jwt.decode(
-        token, secret_key, algorithms=[algo], options={"verify_exp": True}
-    )
+    payload = _decode_cached(token)
     username: str = payload.get("sub")
     return username
@@ -1,8 +1,16 @@
 from typing import List
 
+from pydantic import ConfigDict
 from sqlmodel import SQLModel
 
-class FlightPath(SQLModel):
+
+class Schema(SQLModel):
+    """Base for API request and response schemas, instances are immutable"""
+
+    model_config = ConfigDict(frozen=True)
+
+
+class FlightPath(Schema):
     flight_number: str
     from_airport: str
     to_airport: str
@@ -10,33 +18,18 @@ class FlightPath(SQLModel):
     date: str
 
 
-class CheapestRouteResponse(SQLModel):
+class CheapestRouteResponse(Schema):
     total_price: int
     flights: List[FlightPath]
 
 
-class FlightResponse(SQLModel):
-    flightNumber: str
-    fromAirport: str
-    toAirport: str
-    date: str
-    price: int
-
-
-class OpenUser(SQLModel):
+class OpenUser(Schema):
     id: int
     login: str
     email: str
 
 
-class PaginationResponse(SQLModel):
-    page: int
-    pageSize: int
-    totalElements: int
-    items: list[FlightResponse]
-
-
-class TicketResponse(SQLModel):
+class TicketResponse(Schema):
     ticket_id: int
     flightNumber: str
     fromAirport: str
@@ -46,23 +39,23 @@ class TicketResponse(SQLModel):
     status: str
 
 
-class Token(SQLModel):
+class Token(Schema):
     access_token: str
     token_type: str
 
 
-class TicketPurchaseRequest(SQLModel):
+class TicketPurchaseRequest(Schema):
     flightNumber: str
     paidFromBalance: bool
     bonus_amount: int
 
 
-class PrivilegeDataJSON(SQLModel):
+class PrivilegeDataJSON(Schema):
     balance: int
     status: str
 
 
-class TicketPurchaseResponse(SQLModel):
+class TicketPurchaseResponse(Schema):
     ticket_id: int
     flightNumber: str
     fromAirport: str
@@ -75,60 +68,37 @@ class TicketPurchaseResponse(SQLModel):
     privilege: PrivilegeDataJSON
 
 
-class UserInfoResponse(SQLModel):
+class UserInfoResponse(Schema):
     tickets: list[TicketResponse]
     privilege: PrivilegeDataJSON
 
 
-class HistoryData(SQLModel):
+class HistoryData(Schema):
     date: str
     ticket_id: int
     balanceDiff: int
     operationType: str
 
 
-class PrivilegeInfoResponse(SQLModel):
-    balance: int
-    status: str
-    history: list[HistoryData]
-
-
-class PrivilegeHistoryDataJSON(SQLModel):
+class PrivilegeHistoryDataJSON(Schema):
     status: str
     balance: int
+    totalElements: int
     history: list[HistoryData]
 
 
-class ChangeBonusesJSON(SQLModel):
-    ticket_uid: str
-    name: str
-    bonuses: int
-
-
-class CalculatePriceJSON(SQLModel):
-    name: str
-    price: int
-    paidFromBalance: bool
-    ticketUid: str
-
-
-class CancelTicketJSON(SQLModel):
-    name: str
-    ticketUid: str
-
-
-class PaymentDataJSON(SQLModel):
+class PaymentDataJSON(Schema):
     paidByMoney: int
     paidByBonuses: int
 
 
-class TicketDataJSON(SQLModel):
+class TicketDataJSON(Schema):
     username: str
     flightNumber: str
     price: int
 
 
-class TicketJSON(SQLModel):
+class TicketJSON(Schema):
     id: int
     user_id: int
     flightNumber: str
@@ -136,7 +106,7 @@ class TicketJSON(SQLModel):
     status: str
 
 
-class FlightData(SQLModel):
+class FlightData(Schema):
     flightNumber: str
     fromAirport: str
     toAirport: str
@@ -144,7 +114,7 @@ class FlightData(SQLModel):
     price: int
 
 
-class FlightsResponse(SQLModel):
+class FlightsResponse(Schema):
     page: int
     pageSize: int
     totalElements: int
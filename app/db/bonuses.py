@@ -1,6 +1,14 @@
 import datetime as dt
 
-from sqlmodel import SQLModel, Field, Column, CheckConstraint, TIMESTAMP, String
+from sqlmodel import (
+    SQLModel,
+    Field,
+    Column,
+    CheckConstraint,
+    Index,
+    TIMESTAMP,
+    String,
+)
 
 
 class ChangeBonusesJSON(SQLModel):
@@ -21,11 +29,6 @@ class CancelTicketJSON(SQLModel):
     ticket_id: int
 
 
-class PaymentDataJSON(SQLModel):
-    paidByMoney: int
-    paidByBonuses: int
-
-
 class Privilege(SQLModel, table=True):
     __tablename__ = "privilege"
     id: int = Field(primary_key=True)
@@ -47,4 +50,6 @@ class PrivilegeHistory(SQLModel, table=True):
 
     __table_args__ = (
         CheckConstraint("operation_type in ('FILL_IN_BALANCE', 'DEBIT_THE_ACCOUNT')"),
+        # Covers lookups by privilege alone and by (privilege, ticket) on cancel
+        Index("ix_privhist_priv_ticket", "privilege_id", "ticket_id"),
     )
@@ -6,12 +6,12 @@ from sqlmodel import SQLModel, Field, Column, TIMESTAMP
 class Flight(SQLModel, table=True):
     __tablename__ = "flights"
     id: int = Field(primary_key=True)
-    flight_number: str = Field(nullable=False)
+    flight_number: str = Field(nullable=False, index=True, unique=True)
     datetime: dt.datetime = Field(
         sa_column=Column(TIMESTAMP(timezone=True), nullable=False)
     )
-    from_airport_id: int = Field(foreign_key="airports.id")
-    to_airport_id: int = Field(foreign_key="airports.id")
+    from_airport_id: int = Field(foreign_key="airports.id", index=True)
+    to_airport_id: int = Field(foreign_key="airports.id", index=True)
     price: int = Field(nullable=False)
 
     def __repr__(self):
@@ -2,15 +2,32 @@ import os
 from typing import Annotated
 
 from sqlmodel import create_engine, Session, SQLModel
+from sqlalchemy.orm import sessionmaker
 from fastapi import Depends
 
 database_url = os.environ["DATABASE_URL"]
-print(database_url)
-engine = create_engine(database_url)
-
-
-print(f"Строка подключения к БД: {database_url}")
-engine = create_engine(database_url)
+# Connections are kept open between requests, pre-ping drops ones the server
+# closed and recycle replaces them before idle timeouts on the server side.
+# Size the pool to the workers' concurrency, overflow absorbs short bursts.
+pool_size = int(os.environ.get("DB_POOL_SIZE", 20))
+max_overflow = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+pool_recycle = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+# Set DB_CREATE_TABLES=0 when the schema is created elsewhere, the app then
+# skips create_all on startup
+create_tables_on_startup = os.environ.get("DB_CREATE_TABLES", "1") != "0"
+engine = create_engine(
+    database_url,
+    pool_size=pool_size,
+    max_overflow=max_overflow,
+    pool_pre_ping=True,
+    pool_recycle=pool_recycle,
+)
+
+# Objects stay loaded after commit, so no extra SELECTs are issued
+# when a response is built from freshly committed rows.
+SessionLocal = sessionmaker(
+    bind=engine, class_=Session, expire_on_commit=False, autoflush=False
+)
 
 
 def create_db_and_tables():
@@ -18,8 +35,11 @@ def create_db_and_tables():
 
 
 def get_session():
-    with Session(engine) as session:
+    session = SessionLocal()
+    try:
         yield session
+    finally:
+        session.close()
 
 
 SessionDep = Annotated[Session, Depends(get_session)]
@@ -1,12 +1,18 @@
-from sqlmodel import SQLModel, Field, Column, CheckConstraint, String
+from typing import Optional
+
+from sqlmodel import SQLModel, Field, Column, CheckConstraint, String, Relationship
+
+from .flights import Flight
 
 
 class Ticket(SQLModel, table=True):
     __tablename__ = "tickets"
     id: int = Field(primary_key=True)
-    user_id: int = Field(nullable=False, foreign_key="users.id")
-    flight_id: int = Field(nullable=False, foreign_key="flights.id")
+    user_id: int = Field(nullable=False, foreign_key="users.id", index=True)
+    flight_id: int = Field(nullable=False, foreign_key="flights.id", index=True)
     price: int = Field(nullable=False)
     status: str = Field(sa_column=Column(String, nullable=False))
 
+    flight: Optional[Flight] = Relationship()
+
     __table_args__ = (CheckConstraint("status in ('PAID', 'CANCELED')"),)
@@ -1,7 +1,12 @@
 from sqlmodel import SQLModel, Field
 from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=10, deprecated="auto")
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Verify a plain password against a stored hash"""
+    return pwd_context.verify(plain_password, hashed_password)
 
 
 class User(SQLModel, table=True):
@@ -23,7 +28,7 @@ class User(SQLModel, table=True):
 
     def verify_password(self, plain_password: str) -> bool:
         """Verify a plain password against the stored hash"""
-        return pwd_context.verify(plain_password, self.hashed_password)
+        return verify_password(plain_password, self.hashed_password)
 
 
 class UserCreate(SQLModel):
@@ -2,21 +2,27 @@ from typing import Annotated
 from datetime import datetime
 from contextlib import asynccontextmanager
 import math
-from heapq import heappop, heappush
+import time
 
-from fastapi import FastAPI, Depends, HTTPException, status, Request
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Depends, HTTPException, Query, status, Request
+from fastapi.responses import ORJSONResponse
 from fastapi.exceptions import RequestValidationError
 from fastapi.security import (
     OAuth2PasswordRequestForm,
     HTTPBearer,
     HTTPAuthorizationCredentials,
 )
+from anyio import to_thread
 from sqlmodel import select, Session
+from sqlalchemy import event, exists, lambda_stmt
+from sqlalchemy.orm import aliased
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
 
 from .db.api_responses import (
     Token,
-    PaginationResponse,
+    FlightsResponse,
     TicketResponse,
     TicketPurchaseRequest,
     TicketPurchaseResponse,
@@ -28,12 +34,21 @@ from .db.api_responses import (
     CheapestRouteResponse,
     FlightPath,
 )
-from .db.session import create_db_and_tables, SessionDep
-from .db.users import User, UserCreate
+from .db.session import (
+    create_db_and_tables,
+    SessionDep,
+    SessionLocal,
+    pool_size,
+    max_overflow,
+    create_tables_on_startup,
+)
+from .db.users import User, UserCreate, verify_password
 from .db.bonuses import Privilege, PrivilegeHistory
 from .db.flights import Flight, Airport
 from .db.tickets import Ticket
 from .auth.token import validate_jwt, create_jwt, get_user_from_token
+from .services.airport import load_airports, get_airport
+from .services.dates import format_datetime
 from .services.flight import get_all_flights, get_flight
 from .services.bonus import get_user_privileges, get_privilege_history
 from .services.ticket import get_user_tickets, get_ticket, cancel_ticket
@@ -42,11 +57,19 @@ from .services.ticket import get_user_tickets, get_ticket, cancel_ticket
 @asynccontextmanager
 async def lifespan(application: FastAPI):
     del application
-    create_db_and_tables()
+    # Sync endpoints run in AnyIO's threadpool (40 threads by default),
+    # let it use every connection the DB pool can hand out, but never shrink
+    # it below the default for small pools
+    limiter = to_thread.current_default_thread_limiter()
+    limiter.total_tokens = max(limiter.total_tokens, pool_size + max_overflow)
+    if create_tables_on_startup:
+        create_db_and_tables()
+    with SessionLocal() as session:
+        load_airports(session)
     yield
 
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 
 @app.post("/api/v1/authorize", response_model=Token)
@@ -57,7 +80,16 @@ def login_for_access_token_endpoint(
     """
     Authenticate user and return access token
     """
-    user = db.exec(select(User).where(User.login == form_data.username)).first()
+    username = form_data.username
+    # Only the columns needed for the check, no User instance is built.
+    # lambda_stmt caches the compiled statement, username is a bound parameter
+    user = db.exec(
+        lambda_stmt(
+            lambda: select(User.id, User.login, User.hashed_password).where(
+                User.login == username
+            )
+        )
+    ).first()
 
     if not user:
         raise HTTPException(
@@ -66,7 +98,9 @@ def login_for_access_token_endpoint(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    if not user.verify_password(form_data.password):
+    # bcrypt is slow on purpose, a sync endpoint keeps it and the DB lookup
+    # in the threadpool, off the event loop
+    if not verify_password(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=401,
             detail="Incorrect username or password",
@@ -108,19 +142,20 @@ def create_user_endpoint(user_create: UserCreate, db: SessionDep) -> OpenUser:
     Create a new user account from email, login and password
     """
 
-    # Check if username already exists
-    existing_user = db.exec(select(User).where(User.login == user_create.login)).first()
-    if existing_user:
+    # Check if username or email already exists in a single query,
+    # EXISTS lets the database stop at the first match without reading rows
+    login_taken, email_taken = db.exec(
+        select(
+            exists().where(User.login == user_create.login),
+            exists().where(User.email == user_create.email),
+        )
+    ).one()
+    if login_taken:
         raise HTTPException(
             status_code=404,
             detail="Username already registered",
         )
-
-    # Check if email already exists
-    existing_email = db.exec(
-        select(User).where(User.email == user_create.email)
-    ).first()
-    if existing_email:
+    if email_taken:
         raise HTTPException(status_code=404, detail="Email already registered")
 
     # Create hashed user
@@ -129,7 +164,6 @@ def create_user_endpoint(user_create: UserCreate, db: SessionDep) -> OpenUser:
     # Add to database
     db.add(user)
     db.commit()
-    db.refresh(user)
 
     open_user = OpenUser(id=user.id, login=user.login, email=user.email)
 
@@ -139,11 +173,12 @@ def create_user_endpoint(user_create: UserCreate, db: SessionDep) -> OpenUser:
 # Flight endpoints
 @app.get("/api/v1/flights", status_code=200)
 def get_flights_endpoint(
-    page: int,
-    size: int,
+    # size=-1 returns every flight, other negatives would reach LIMIT
+    page: Annotated[int, Query(ge=1)],
+    size: Annotated[int, Query(ge=-1)],
     session: SessionDep,
     user_info: dict = Depends(auth_dependency),
-) -> PaginationResponse:
+) -> FlightsResponse:
     del user_info
     return get_all_flights(page, size, session)
 
@@ -163,13 +198,14 @@ def get_tickets_endpoint(
     session: SessionDep, user_info: dict = Depends(auth_dependency)
 ) -> list[TicketResponse]:
     user_id = user_info["id"]
-    return get_user_tickets(user_id, session)
+    # Tickets are built by the service, skip the response_model validation pass
+    return ORJSONResponse(content=get_user_tickets(user_id, session))
 
 
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc):
     del request
-    return JSONResponse({"message": "what", "errors": exc.errors()[0]}, status_code=400)
+    return ORJSONResponse({"message": "what", "errors": exc.errors()[0]}, status_code=400)
 
 
 @app.post("/api/v1/tickets", status_code=200)
@@ -180,16 +216,20 @@ def create_ticket_endpoint(
 ) -> TicketPurchaseResponse:
     user_id = user_info["id"]
 
-    # Get flight info
-    flight = session.exec(
-        select(Flight).where(
-            Flight.flight_number == ticket_purchase_request.flightNumber
-        )
+    # Get flight info and the user's privilege (if any) in one query,
+    # airports come from the in-memory cache
+    row = session.exec(
+        select(Flight, Privilege)
+        .outerjoin(Privilege, Privilege.user_id == user_id)
+        .where(Flight.flight_number == ticket_purchase_request.flightNumber)
     ).first()
-    if not flight:
+    if not row:
         raise HTTPException(status_code=404, detail="Flight not found")
+    flight, privilege = row
+    from_airport = get_airport(flight.from_airport_id, session)
+    to_airport = get_airport(flight.to_airport_id, session)
 
-    # Create ticket
+    # Create ticket, flush to get its id without committing
     ticket = Ticket(
         user_id=user_id,
         flight_id=flight.id,
@@ -197,29 +237,29 @@ def create_ticket_endpoint(
         status="PAID",
     )
     session.add(ticket)
-    session.commit()
-    session.refresh(ticket)
-
-    # Calculate price with bonuses
-    privilege = session.exec(
-        select(Privilege).where(Privilege.user_id == user_id)
-    ).first()
 
     if not privilege:
         privilege = Privilege(user_id=user_id, status="BRONZE", balance=0)
         session.add(privilege)
-        session.commit()
+    session.flush()
 
+    # All payment values are computed in one pass with integer arithmetic.
+    # balance_diff is stored as a positive amount, operation_type gives the sign.
+    price = flight.price
     if ticket_purchase_request.paidFromBalance:
-        paid_by_bonuses = min(ticket_purchase_request.bonus_amount, privilege.balance)
-        new_balance = privilege.balance - paid_by_bonuses
-        paid_by_money = flight.price - paid_by_bonuses
+        paid_by_bonuses = min(
+            ticket_purchase_request.bonus_amount, privilege.balance, price
+        )
+        paid_by_money = price - paid_by_bonuses
         balance_diff = paid_by_bonuses
+        new_balance = privilege.balance - paid_by_bonuses
+        operation_type = "DEBIT_THE_ACCOUNT"
     else:
-        paid_by_money = flight.price
+        paid_by_money = price
         paid_by_bonuses = 0
-        balance_diff = int(flight.price * 0.1)  # 10% bonus
+        balance_diff = price // 10  # 10% bonus
         new_balance = privilege.balance + balance_diff
+        operation_type = "FILL_IN_BALANCE"
 
     # Update privilege
     privilege.balance = new_balance
@@ -231,38 +271,32 @@ def create_ticket_endpoint(
         ticket_id=ticket.id,
         datetime=datetime.now(),
         balance_diff=balance_diff,
-        operation_type="FILL_IN_BALANCE"
-        if not ticket_purchase_request.paidFromBalance
-        else "DEBIT_THE_ACCOUNT",
+        operation_type=operation_type,
     )
     session.add(history)
+    # The whole purchase is committed at once
     session.commit()
 
-    # Prepare airports info
-    from_airport = session.exec(
-        select(Airport).where(Airport.id == flight.from_airport_id)
-    ).first()
-    to_airport = session.exec(
-        select(Airport).where(Airport.id == flight.to_airport_id)
-    ).first()
-
-    return TicketPurchaseResponse(
+    # Every value was just read from or written to the database, skip validation
+    return TicketPurchaseResponse.model_construct(
         ticket_id=ticket.id,
         flightNumber=flight.flight_number,
-        fromAirport=f"{from_airport.city} {from_airport.name}",
-        toAirport=f"{to_airport.city} {to_airport.name}",
-        date=flight.datetime.astimezone().strftime("%Y-%m-%d %H:%M"),
-        price=flight.price,
+        fromAirport=from_airport,
+        toAirport=to_airport,
+        date=format_datetime(flight.datetime),
+        price=price,
         paidByMoney=paid_by_money,
         paidByBonuses=paid_by_bonuses,
         status=ticket.status,
-        privilege=PrivilegeDataJSON(balance=privilege.balance, status=privilege.status),
+        privilege=PrivilegeDataJSON.model_construct(
+            balance=privilege.balance, status=privilege.status
+        ),
     )
 
 
 @app.get("/api/v1/tickets/{ticket_id}", status_code=200)
 def ticket_info_endpoint(
-    ticket_id: str, session: SessionDep, user_info: dict = Depends(auth_dependency)
+    ticket_id: int, session: SessionDep, user_info: dict = Depends(auth_dependency)
 ) -> TicketResponse:
     user_id = user_info["id"]
     return get_ticket(user_id, ticket_id, session)
@@ -318,77 +352,129 @@ def get_user_info_endpoint(
 
 @app.get("/api/v1/privilege", status_code=200)
 def privilege_info_endpoint(
-    session: SessionDep, user_info: dict = Depends(auth_dependency)
+    session: SessionDep,
+    user_info: dict = Depends(auth_dependency),
+    # size=-1 returns the whole history, other negatives would reach LIMIT
+    page: Annotated[int, Query(ge=1)] = 1,
+    size: Annotated[int, Query(ge=-1)] = -1,
 ) -> PrivilegeHistoryDataJSON:
     user_id = user_info["id"]
-    return get_privilege_history(user_id, session)
+    return get_privilege_history(user_id, session, page, size)
 
 
 def build_flight_graph(session: Session):
     """Build a graph representation of all flights"""
-    flights = session.exec(select(Flight)).all()
-    graph = {}
-
-    for flight in flights:
-        from_airport = session.exec(
-            select(Airport).where(Airport.id == flight.from_airport_id)
-        ).first()
-        to_airport = session.exec(
-            select(Airport).where(Airport.id == flight.to_airport_id)
-        ).first()
-
-        if from_airport.name not in graph:
-            graph[from_airport.name] = []
-
-        graph[from_airport.name].append(
-            {
-                "to": to_airport.name,
-                "flight_number": flight.flight_number,
-                "price": flight.price,
-                "date": flight.datetime.strftime("%Y-%m-%d"),
-            }
+    from_airport = aliased(Airport)
+    to_airport = aliased(Airport)
+    flights = session.exec(
+        select(
+            Flight.flight_number,
+            Flight.price,
+            Flight.datetime,
+            from_airport.name.label("from_name"),
+            to_airport.name.label("to_name"),
         )
+        .join(from_airport, Flight.from_airport_id == from_airport.id)
+        .join(to_airport, Flight.to_airport_id == to_airport.id)
+    ).all()
+    # Airports are numbered in order of appearance. Only the cheapest flight
+    # is kept for every airport pair since csr_matrix sums duplicate entries,
+    # pair_edges maps (from_idx, to_idx) to the position of that flight in
+    # the per-edge columns below
+    airports = {}
+    pair_edges = {}
+    src, dst, prices, flight_numbers, dates = [], [], [], [], []
 
+    for flight in flights:
+        from_idx = airports.setdefault(flight.from_name, len(airports))
+        to_idx = airports.setdefault(flight.to_name, len(airports))
+        edge_idx = pair_edges.get((from_idx, to_idx))
+        if edge_idx is None:
+            pair_edges[(from_idx, to_idx)] = len(src)
+            src.append(from_idx)
+            dst.append(to_idx)
+            prices.append(flight.price)
+            flight_numbers.append(flight.flight_number)
+            dates.append(flight.datetime.strftime("%Y-%m-%d"))
+        elif flight.price < prices[edge_idx]:
+            prices[edge_idx] = flight.price
+            flight_numbers[edge_idx] = flight.flight_number
+            dates[edge_idx] = flight.datetime.strftime("%Y-%m-%d")
+
+    size = len(airports)
+    src = np.array(src, dtype=np.int32)
+    dst = np.array(dst, dtype=np.int32)
+    prices = np.array(prices, dtype=np.int32)
+    matrix = csr_matrix((prices, (src, dst)), shape=(size, size))
+
+    return {
+        "airports": airports,
+        "names": list(airports),
+        "pair_edges": pair_edges,
+        "prices": prices,
+        "flight_numbers": flight_numbers,
+        "dates": dates,
+        "matrix": matrix,
+    }
+
+
+# The flight graph changes rarely, so it is cached in-process. Writes to
+# flights or airports through the ORM drop it, the TTL covers writes made
+# by other workers or directly in the database.
+GRAPH_CACHE_TTL = 60
+_graph_cache = {"data": None, "ts": 0.0}
+
+
+def _invalidate_flight_graph(*args):
+    del args
+    _graph_cache["data"] = None
+
+
+for _model in (Flight, Airport):
+    for _event in ("after_insert", "after_update", "after_delete"):
+        event.listen(_model, _event, _invalidate_flight_graph)
+
+
+def get_flight_graph(session: Session):
+    """Return the cached flight graph, rebuilding it when stale"""
+    graph = _graph_cache["data"]
+    if graph is None or time.monotonic() - _graph_cache["ts"] > GRAPH_CACHE_TTL:
+        graph = build_flight_graph(session)
+        _graph_cache["data"] = graph
+        _graph_cache["ts"] = time.monotonic()
     return graph
 
 
 def find_cheapest_route(graph, start, end):
     """Dijkstra's algorithm to find cheapest route"""
-    prices = {airport: math.inf for airport in graph}
-    prices[start] = 0
-    previous = {airport: None for airport in graph}
-    queue = [(0, start)]
-
-    while queue:
-        current_price, current_airport = heappop(queue)
+    start_idx = graph["airports"][start]
+    end_idx = graph["airports"][end]
 
-        if current_airport == end:
-            break
-
-        if current_price > prices[current_airport]:
-            continue
-
-        for flight in graph.get(current_airport, []):
-            neighbor = flight["to"]
-            price = current_price + flight["price"]
+    prices, previous = dijkstra(
+        graph["matrix"], directed=True, indices=start_idx, return_predecessors=True
+    )
 
-            if price < prices[neighbor]:
-                prices[neighbor] = price
-                previous[neighbor] = (current_airport, flight)
-                heappush(queue, (price, neighbor))
+    if np.isinf(prices[end_idx]):
+        return {"total_price": math.inf, "flights": []}
 
     # Reconstruct path
     path = []
-    current = end
-
-    while previous[current]:
-        prev_airport, flight = previous[current]
-        path.append(flight)
-        current = prev_airport
-
+    current = end_idx
+    while current != start_idx:
+        prev = int(previous[current])
+        edge_idx = graph["pair_edges"][(prev, current)]
+        path.append(
+            {
+                "to": graph["names"][current],
+                "flight_number": graph["flight_numbers"][edge_idx],
+                "price": int(graph["prices"][edge_idx]),
+                "date": graph["dates"][edge_idx],
+            }
+        )
+        current = prev
     path.reverse()
 
-    return {"total_price": prices[end], "flights": path}
+    return {"total_price": int(prices[end_idx]), "flights": path}
 
 
 @app.get("/api/v1/routes/cheapest", status_code=200)
@@ -403,16 +489,16 @@ def get_cheapest_route(
     """
     del user_info
 
-    # Build flight graph
-    graph = build_flight_graph(session)
+    # Get flight graph
+    graph = get_flight_graph(session)
 
     # Check if airports exist
-    if from_airport not in graph:
+    if from_airport not in graph["airports"]:
         raise HTTPException(
             status_code=404, detail=f"Departure airport '{from_airport}' not found"
         )
 
-    if to_airport not in graph:
+    if to_airport not in graph["airports"]:
         raise HTTPException(
             status_code=404, detail=f"Arrival airport '{to_airport}' not found"
         )
@@ -426,9 +512,9 @@ def get_cheapest_route(
             detail=f"No available route from {from_airport} to {to_airport}",
         )
 
-    # Format response
+    # Format response, the graph is built from database rows so skip validation
     flights = [
-        FlightPath(
+        FlightPath.model_construct(
             flight_number=f["flight_number"],
             from_airport=from_airport if i == 0 else route["flights"][i - 1]["to"],
             to_airport=f["to"],
@@ -438,4 +524,6 @@ def get_cheapest_route(
         for i, f in enumerate(route["flights"])
     ]
 
-    return CheapestRouteResponse(total_price=route["total_price"], flights=flights)
+    return CheapestRouteResponse.model_construct(
+        total_price=route["total_price"], flights=flights
+    )
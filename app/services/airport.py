@@ -0,0 +1,22 @@
+from sqlmodel import select, Session
+
+from ..db.flights import Airport
+
+# Airports change rarely, so the whole table is kept in memory as
+# {id: "city name"}, already formatted the way responses show it
+_AIRPORT_DISPLAY: dict[int, str] = {}
+
+
+def load_airports(session: Session) -> None:
+    """Load all airports into the in-memory cache"""
+    rows = session.exec(select(Airport.id, Airport.city, Airport.name)).all()
+    _AIRPORT_DISPLAY.update({row.id: f"{row.city} {row.name}" for row in rows})
+
+
+def get_airport(airport_id: int, session: Session) -> str:
+    """Get "city name" of an airport, reloading the cache for unknown ids"""
+    airport = _AIRPORT_DISPLAY.get(airport_id)
+    if airport is None:
+        load_airports(session)
+        airport = _AIRPORT_DISPLAY[airport_id]
+    return airport
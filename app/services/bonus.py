@@ -1,53 +1,70 @@
-from fastapi import *
-from fastapi.responses import *
-from fastapi.exceptions import RequestValidationError
-from sqlmodel import *
-from ..db.bonuses import *
+from fastapi.responses import ORJSONResponse
+from sqlmodel import select, text
+from sqlalchemy import lambda_stmt
+from ..db.bonuses import (
+    Privilege,
+    PrivilegeHistory,
+    ChangeBonusesJSON,
+    CalculatePriceJSON,
+    CancelTicketJSON,
+)
 from ..db.session import SessionDep
-from ..db.api_responses import PrivilegeDataJSON, PrivilegeHistoryDataJSON, HistoryData
-from typing import Annotated
-from fastapi.encoders import jsonable_encoder
-from contextlib import asynccontextmanager
-import uvicorn
-from multiprocessing import Process
-import os
+from ..db.api_responses import (
+    PrivilegeDataJSON,
+    PrivilegeHistoryDataJSON,
+    PaymentDataJSON,
+)
 import datetime as dt
 
 
 def get_user_privileges(user_id: int, session: SessionDep) -> PrivilegeDataJSON:
     privilege = session.exec(
-        select(Privilege).where(Privilege.user_id == user_id)
-    ).first()
+        lambda_stmt(lambda: select(Privilege).where(Privilege.user_id == user_id))
+    ).scalars().first()
     if not privilege:
-        return JSONResponse(content={"message": "User not found"}, status_code=404)
+        return ORJSONResponse(content={"message": "User not found"}, status_code=404)
     return privilege
 
 
 def get_privilege_history(
-    user_id: int, session: SessionDep
+    user_id: int, session: SessionDep, page: int = 1, size: int = -1
 ) -> PrivilegeHistoryDataJSON:
-    query = select(Privilege).where(Privilege.user_id == user_id)
-    privilege = session.exec(query).first()
+    query = lambda_stmt(lambda: select(Privilege).where(Privilege.user_id == user_id))
+    privilege = session.exec(query).scalars().first()
     if not privilege:
-        return JSONResponse(content={"message": "User not found"}, status_code=404)
+        return ORJSONResponse(content={"message": "User not found"}, status_code=404)
+    # The privilege is already loaded, so read only the history columns,
+    # and only for the requested page
     query = (
-        select(Privilege, PrivilegeHistory)
-        .where(Privilege.user_id == user_id)
-        .join(PrivilegeHistory, Privilege.id == PrivilegeHistory.privilege_id)
+        """SELECT datetime, ticket_id, balance_diff, operation_type """
+        """FROM privilege_history WHERE privilege_id = :privilege_id ORDER BY id"""
     )
-    history = session.exec(query).all()
-    items = []
-    for h in history:
-        items.append(
-            HistoryData(
-                date=str(h[1].datetime),
-                ticket_id=str(h[1].ticket_id),
-                balanceDiff=h[1].balance_diff,
-                operationType=h[1].operation_type,
-            )
-        )
-    return PrivilegeHistoryDataJSON(
-        status=privilege.status, balance=privilege.balance, history=items
+    params = {"privilege_id": privilege.id}
+    if size != -1:
+        query += " limit :size offset :offset"
+        params.update(size=size, offset=max(page - 1, 0) * size)
+    history = session.exec(text(query), params=params).all()
+    total = session.exec(
+        text(
+            "SELECT COUNT(*) FROM privilege_history WHERE privilege_id = :privilege_id"
+        ),
+        params={"privilege_id": privilege.id},
+    ).scalar_one()
+    return ORJSONResponse(
+        content={
+            "status": privilege.status,
+            "balance": privilege.balance,
+            "totalElements": total,
+            "history": [
+                {
+                    "date": str(h.datetime),
+                    "ticket_id": h.ticket_id,
+                    "balanceDiff": h.balance_diff,
+                    "operationType": h.operation_type,
+                }
+                for h in history
+            ],
+        }
     )
 
 
@@ -55,18 +72,13 @@ def reduce_bonuses(reduce: ChangeBonusesJSON, session: SessionDep) -> PrivilegeD
     query = select(Privilege).where(Privilege.user_id == reduce.user_id)
     privilege = session.exec(query).first()
     if not privilege:
-        return JSONResponse(content={"message": "User not found"}, status_code=404)
+        return ORJSONResponse(content={"message": "User not found"}, status_code=404)
     new_balance = privilege.balance - reduce.bonuses
     if new_balance < 0:
         new_balance = 0
-    query = (
-        update(Privilege)
-        .where(Privilege.id == privilege.id)
-        .values(balance=new_balance)
-    )
-    session.exec(query)
-    session.commit()
-    session.refresh(privilege)
+    # Balance and history are written in one transaction
+    privilege.balance = new_balance
+    session.add(privilege)
     session.add(
         PrivilegeHistory(
             privilege_id=privilege.id,
@@ -84,16 +96,11 @@ def add_bonuses(add: ChangeBonusesJSON, session: SessionDep) -> PrivilegeDataJSO
     query = select(Privilege).where(Privilege.user_id == add.user_id)
     privilege = session.exec(query).first()
     if not privilege:
-        return JSONResponse(content={"message": "User not found"}, status_code=404)
+        return ORJSONResponse(content={"message": "User not found"}, status_code=404)
     new_balance = privilege.balance + add.bonuses
-    query = (
-        update(Privilege)
-        .where(Privilege.id == privilege.id)
-        .values(balance=new_balance)
-    )
-    session.exec(query)
-    session.commit()
-    session.refresh(privilege)
+    # Balance and history are written in one transaction
+    privilege.balance = new_balance
+    session.add(privilege)
     session.add(
         PrivilegeHistory(
             privilege_id=privilege.id,
@@ -114,7 +121,7 @@ def calculate_price(
     privilege = session.exec(query).first()
 
     if not privilege:
-        return JSONResponse(content={"message": "User not found"}, status_code=404)
+        return ORJSONResponse(content={"message": "User not found"}, status_code=404)
 
     if not calculatePriceJSON.paidFromBalance:
         additional_bonuses = round(0.1 * calculatePriceJSON.price)
@@ -157,7 +164,7 @@ def cancel(
     )
     privilege_history = session.exec(query).first()
     if not privilege_history:
-        return JSONResponse(
+        return ORJSONResponse(
             content={"message": "User or ticket not found"}, status_code=404
         )
 
@@ -0,0 +1,35 @@
+import datetime as dt
+import os
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+
+def _local_zone():
+    """Resolve the local timezone with its DST rules, None if it is unknown"""
+    name = os.environ.get("TZ", "").lstrip(":")
+    if name:
+        try:
+            return ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError):
+            pass
+    try:
+        with open("/etc/localtime", "rb") as localtime:
+            return ZoneInfo.from_file(localtime, key="localtime")
+    except (OSError, ValueError):
+        # astimezone(None) falls back to the system local time on every call
+        return None
+
+
+# The local timezone is resolved once instead of on every astimezone() call
+LOCAL_TZ = _local_zone()
+
+
+def format_datetime(value: dt.datetime) -> str:
+    """Format a flight time as local "YYYY-MM-DD HH:MM" """
+    value = value.astimezone(LOCAL_TZ)
+    return "%04d-%02d-%02d %02d:%02d" % (
+        value.year,
+        value.month,
+        value.day,
+        value.hour,
+        value.minute,
+    )
@@ -1,49 +1,47 @@
-from sqlmodel import select, Session, update
+from sqlmodel import select, Session
+from sqlalchemy import lambda_stmt
+from sqlalchemy.orm import joinedload
 from fastapi import HTTPException
 from ..db.tickets import Ticket
 from ..db.api_responses import (
     TicketDataJSON,
     TicketJSON,
     TicketResponse,
-    FlightData,
     PaymentDataJSON,
 )
-from ..db.flights import Flight, Airport
+from ..db.flights import Flight
 from ..db.bonuses import Privilege, PrivilegeHistory
+from .airport import get_airport
+from .dates import format_datetime
 import datetime as dt
 from typing import Optional
 
 
-def get_user_tickets(user_id: int, session: Session) -> list[TicketResponse]:
-    """Get all tickets for a user"""
-    query = select(Ticket).where(Ticket.user_id == user_id)
-    tickets = session.exec(query).all()
+def get_user_tickets(user_id: int, session: Session) -> list[dict]:
+    """Get all tickets for a user as plain dicts shaped like TicketResponse"""
+    # Flights are loaded in the same query, the compiled statement is cached
+    query = lambda_stmt(
+        lambda: select(Ticket)
+        .where(Ticket.user_id == user_id)
+        .options(joinedload(Ticket.flight))
+    )
+    tickets = session.exec(query).scalars().all()
 
     response = []
     for ticket in tickets:
-        # Get flight info for each ticket
-        flight = session.exec(
-            select(Flight).where(Flight.id == ticket.flight_id)
-        ).first()
+        flight = ticket.flight
 
         if flight:
-            from_airport = session.exec(
-                select(Airport).where(Airport.id == flight.from_airport_id)
-            ).first()
-            to_airport = session.exec(
-                select(Airport).where(Airport.id == flight.to_airport_id)
-            ).first()
-
             response.append(
-                TicketResponse(
-                    ticket_id=ticket.id,
-                    flightNumber=flight.flight_number,
-                    fromAirport=f"{from_airport.city} {from_airport.name}",
-                    toAirport=f"{to_airport.city} {to_airport.name}",
-                    date=flight.datetime.astimezone().strftime("%Y-%m-%d %H:%M"),
-                    price=flight.price,
-                    status=ticket.status,
-                )
+                {
+                    "ticket_id": ticket.id,
+                    "flightNumber": flight.flight_number,
+                    "fromAirport": get_airport(flight.from_airport_id, session),
+                    "toAirport": get_airport(flight.to_airport_id, session),
+                    "date": format_datetime(flight.datetime),
+                    "price": flight.price,
+                    "status": ticket.status,
+                }
             )
 
     return response
@@ -52,30 +50,29 @@ def get_user_tickets(user_id: int, session: Session) -> list[TicketResponse]:
 def get_ticket(user_id: int, ticket_id: int, session: Session) -> TicketResponse:
     """Get single ticket by ID for a specific user"""
     ticket = session.exec(
-        select(Ticket).where((Ticket.id == ticket_id) & (Ticket.user_id == user_id))
+        select(Ticket)
+        .where((Ticket.id == ticket_id) & (Ticket.user_id == user_id))
+        .options(joinedload(Ticket.flight))
     ).first()
 
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
 
-    flight = session.exec(select(Flight).where(Flight.id == ticket.flight_id)).first()
+    flight = ticket.flight
 
     if not flight:
         raise HTTPException(status_code=404, detail="Flight not found")
 
-    from_airport = session.exec(
-        select(Airport).where(Airport.id == flight.from_airport_id)
-    ).first()
-    to_airport = session.exec(
-        select(Airport).where(Airport.id == flight.to_airport_id)
-    ).first()
+    from_airport = get_airport(flight.from_airport_id, session)
+    to_airport = get_airport(flight.to_airport_id, session)
 
-    return TicketResponse(
+    # Values come straight from the database, skip validation
+    return TicketResponse.model_construct(
         ticket_id=ticket.id,
         flightNumber=flight.flight_number,
-        fromAirport=f"{from_airport.city} {from_airport.name}",
-        toAirport=f"{to_airport.city} {to_airport.name}",
-        date=flight.datetime.astimezone().strftime("%Y-%m-%d %H:%M"),
+        fromAirport=from_airport,
+        toAirport=to_airport,
+        date=format_datetime(flight.datetime),
         price=flight.price,
         status=ticket.status,
     )
@@ -101,7 +98,6 @@ def create_ticket(
     )
     session.add(ticket)
     session.commit()
-    session.refresh(ticket)
 
     return TicketJSON(
         id=ticket.id,
@@ -117,7 +113,9 @@ def cancel_ticket(
 ) -> Optional[TicketJSON]:
     """Cancel a ticket and refund bonuses if applicable"""
     ticket = session.exec(
-        select(Ticket).where((Ticket.id == ticket_id) & (Ticket.user_id == user_id))
+        select(Ticket)
+        .where((Ticket.id == ticket_id) & (Ticket.user_id == user_id))
+        .options(joinedload(Ticket.flight))
     ).first()
 
     if not ticket:
@@ -126,7 +124,7 @@ def cancel_ticket(
     if ticket.status == "CANCELED":
         return None
 
-    flight = session.exec(select(Flight).where(Flight.id == ticket.flight_id)).first()
+    flight = ticket.flight
 
     # Update ticket status
     ticket.status = "CANCELED"
@@ -156,7 +154,6 @@ def cancel_ticket(
             session.add(privilege)
 
     session.commit()
-    session.refresh(ticket)
 
     return TicketJSON(
         id=ticket.id,
@@ -182,7 +179,8 @@ def calculate_ticket_price(
     if not privilege:
         privilege = Privilege(user_id=user_id, status="BRONZE", balance=0)
         session.add(privilege)
-        session.commit()
+        # Flush only to get the id, everything is committed once below
+        session.flush()
 
     if not paid_from_balance:
         # Add 10% bonus
@@ -0,0 +1,66 @@
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+from filelock import FileLock
+
+# Every xdist worker is a separate process with its own engine, keep the
+# per-worker pool small so parallel runs stay under the server's connection
+# limit. Set before the app creates the engine, explicit values still win.
+os.environ.setdefault("DB_POOL_SIZE", "5")
+os.environ.setdefault("DB_MAX_OVERFLOW", "10")
+# Tables are created by the locked seeding below, not by every worker's
+# app lifespan
+os.environ.setdefault("DB_CREATE_TABLES", "0")
+
+from ..app.main import app
+from ..app.db.session import engine, get_session, SessionLocal
+from .init_db import fill_test_db
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _seed_db(tmp_path_factory, worker_id):
+    """Fill the test database once, before any test uses it"""
+    if worker_id == "master":
+        # Not running under xdist
+        fill_test_db()
+        return
+
+    # xdist workers share the base temp dir, the first one to take the lock
+    # creates the tables and seeds the database, the rest see the marker
+    # file and skip the DDL and the data check entirely
+    root_tmp_dir = tmp_path_factory.getbasetemp().parent
+    done_path = root_tmp_dir / "db_seed.done"
+    with FileLock(str(root_tmp_dir / "db_seed.lock")):
+        if not done_path.exists():
+            fill_test_db()
+            done_path.touch()
+
+
+@pytest.fixture(scope="session")
+def client():
+    """One TestClient, and one app lifespan, for the whole test run"""
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def db():
+    """Session inside a transaction that is rolled back after the test
+
+    The app is switched to the same session, so rows written through the API
+    are rolled back too. Commits only release a savepoint.
+    """
+    connection = engine.connect()
+    transaction = connection.begin()
+    # Same expiry and flush rules as the app's sessions
+    session = SessionLocal(bind=connection, join_transaction_mode="create_savepoint")
+    app.dependency_overrides[get_session] = lambda: session
+    try:
+        yield session
+    finally:
+        del app.dependency_overrides[get_session]
+        session.close()
+        # Closing the session alone would leave the transaction open
+        transaction.rollback()
+        connection.close()
@@ -1,18 +1,9 @@
 from typing import Dict
 
 import pytest
-from fastapi.testclient import TestClient
-from sqlmodel import Session, select
+from sqlmodel import select
 
-from ..app.main import app
-from ..app.db.session import engine
 from ..app.db.users import User
-from .init_db import fill_test_db
-
-fill_test_db()
-
-client = TestClient(app)
-session = Session(engine)
 
 # Test data constants
 TEST_USERNAME = "testuser"
@@ -22,28 +13,27 @@ TEST_CLIENT_SECRET = "testsecret"
 FLIGHT_NUMBER = "AFL031"
 TICKET_PRICE = 1500
 
-
-# Helper functions
-def get_auth_headers() -> Dict[str, str]:
-    """Get authorization headers with valid token"""
-    # First get the token
-    token_response = client.post(
-        "/api/v1/authorize",
-        data={
-            "username": TEST_USERNAME,
-            "password": TEST_PASSWORD,
-            "client_id": TEST_CLIENT_ID,
-            "client_secret": TEST_CLIENT_SECRET,
-            "grant_type": "password",
-            "scope": "openid",
-        },
-    )
+# Password grant form for the test user
+_AUTH_FORM = {
+    "username": TEST_USERNAME,
+    "password": TEST_PASSWORD,
+    "client_id": TEST_CLIENT_ID,
+    "client_secret": TEST_CLIENT_SECRET,
+    "grant_type": "password",
+    "scope": "openid",
+}
+
+
+@pytest.fixture(scope="session")
+def auth_headers(client) -> Dict[str, str]:
+    """Authorization headers with a token issued once for the whole run"""
+    token_response = client.post("/api/v1/authorize", data=_AUTH_FORM)
     assert token_response.status_code == 200
     token = token_response.json()["access_token"]
     return {"Authorization": f"Bearer {token}"}
 
 
-def test_register_new_user():
+def test_register_new_user(client, db):
     """Test successful user registration"""
     # Test user data
     test_user_data = {
@@ -52,43 +42,25 @@ def test_register_new_user():
         "password": "securepassword123",
     }
 
-    try:
-        # 1. Make registration request
-        response = client.post("/api/v1/register", json=test_user_data)
-
-        # 2. Verify successful response
-        assert response.status_code == 201
-        response_data = response.json()
-        assert response_data["login"] == test_user_data["login"]
-        assert response_data["email"] == test_user_data["email"]
-        assert (
-            "hashed_password" not in response_data
-        )  # Sensitive field should not be returned
-
-        # 3. Verify user exists in database
-        db_user = session.exec(
-            select(User).where(User.login == test_user_data["login"])
-        ).first()
-        assert db_user is not None
-        assert db_user.email == test_user_data["email"]
-
-    finally:
-        # 4. Cleanup - delete test user
-        if "db_user" not in locals():
-            db_user = session.exec(
-                select(User).where(User.login == test_user_data["login"])
-            ).first()
-
-    session.delete(db_user)
-    session.commit()
-    # Verify deletion
-    deleted_user = session.exec(
-        select(User).where(User.login == test_user_data["login"])
-    ).first()
-    assert deleted_user is None
-
-
-def test_register_existing_username():
+    # 1. Make registration request
+    response = client.post("/api/v1/register", json=test_user_data)
+
+    # 2. Verify successful response
+    assert response.status_code == 201
+    response_data = response.json()
+    assert response_data["login"] == test_user_data["login"]
+    assert response_data["email"] == test_user_data["email"]
+    assert (
+        "hashed_password" not in response_data
+    )  # Sensitive field should not be returned
+
+    # 3. Verify user exists in database, the rollback removes it afterwards
+    db_user = db.exec(select(User).where(User.login == test_user_data["login"])).first()
+    assert db_user is not None
+    assert db_user.email == test_user_data["email"]
+
+
+def test_register_existing_username(client, db):
     """Test registration with existing username"""
     # First create a test user
     existing_user = User(
@@ -96,30 +68,24 @@ def test_register_existing_username():
         email="existing@example.com",
         hashed_password="hashedpassword123",
     )
-    session.add(existing_user)
-    session.commit()
-
-    try:
-        # Attempt to register with same username
-        response = client.post(
-            "/api/v1/register",
-            json={
-                "login": "existing_user",
-                "email": "new@example.com",
-                "password": "newpassword123",
-            },
-        )
+    db.add(existing_user)
+    db.commit()
 
-        assert response.status_code == 404
-        assert "Username already registered" in response.json()["detail"]
+    # Attempt to register with same username
+    response = client.post(
+        "/api/v1/register",
+        json={
+            "login": "existing_user",
+            "email": "new@example.com",
+            "password": "newpassword123",
+        },
+    )
 
-    finally:
-        # Cleanup
-        session.delete(existing_user)
-        session.commit()
+    assert response.status_code == 404
+    assert "Username already registered" in response.json()["detail"]
 
 
-def test_register_existing_email():
+def test_register_existing_email(client, db):
     """Test registration with existing email"""
     # First create a test user
     existing_user = User(
@@ -127,42 +93,26 @@ def test_register_existing_email():
         email="existing_email@example.com",
         hashed_password="hashedpassword123",
     )
-    session.add(existing_user)
-    session.commit()
-
-    try:
-        # Attempt to register with same email
-        response = client.post(
-            "/api/v1/register",
-            json={
-                "login": "new_user",
-                "email": "existing_email@example.com",
-                "password": "newpassword123",
-            },
-        )
+    db.add(existing_user)
+    db.commit()
 
-        assert response.status_code == 404
-        assert "Email already registered" in response.json()["detail"]
+    # Attempt to register with same email
+    response = client.post(
+        "/api/v1/register",
+        json={
+            "login": "new_user",
+            "email": "existing_email@example.com",
+            "password": "newpassword123",
+        },
+    )
 
-    finally:
-        # Cleanup
-        session.delete(existing_user)
-        session.commit()
+    assert response.status_code == 404
+    assert "Email already registered" in response.json()["detail"]
 
 
-def test_get_token():
+def test_get_token(client):
     """Test obtaining an access token"""
-    response = client.post(
-        "/api/v1/authorize",
-        data={
-            "username": TEST_USERNAME,
-            "password": TEST_PASSWORD,
-            "client_id": TEST_CLIENT_ID,
-            "client_secret": TEST_CLIENT_SECRET,
-            "grant_type": "password",
-            "scope": "openid",
-        },
-    )
+    response = client.post("/api/v1/authorize", data=_AUTH_FORM)
 
     assert response.status_code == 200
     assert "application/json" in response.headers["content-type"]
@@ -170,25 +120,38 @@ def test_get_token():
     assert response.json()["access_token"] is not None
 
 
-def test_get_current_user_success():
-    """Test successful current user retrieval using authorization endpoint"""
-    # 1. First authenticate to get JWT token
-    auth_response = client.post(
-        "/api/v1/authorize",
-        data={
-            "username": "testuser",
-            "password": "testpassword",
-            "grant_type": "password",
-            "scope": "openid",
-        },
-    )
-    assert auth_response.status_code == 200
-    token = auth_response.json()["access_token"]
+def test_login_after_register_unknown_user(client, db):
+    """Test that a login rejected as unknown works once the user registers"""
+    test_user_data = {
+        "login": "late_test_user",
+        "email": "late_test@example.com",
+        "password": "securepassword123",
+    }
+    login_data = {
+        "username": test_user_data["login"],
+        "password": test_user_data["password"],
+        "grant_type": "password",
+        "scope": "openid",
+    }
+
+    # 1. Unknown login is rejected
+    response = client.post("/api/v1/authorize", data=login_data)
+    assert response.status_code == 401
+
+    # 2. After registration the same login succeeds
+    response = client.post("/api/v1/register", json=test_user_data)
+    assert response.status_code == 201
 
+    response = client.post("/api/v1/authorize", data=login_data)
+    assert response.status_code == 200
+    assert response.json()["access_token"] is not None
+
+
+def test_get_current_user_success(client, auth_headers):
+    """Test successful current user retrieval using authorization endpoint"""
+    # 1. The token comes from the authorization endpoint via auth_headers
     # 2. Now make authenticated request to current_user endpoint
-    response = client.get(
-        "/api/v1/current_user", headers={"Authorization": f"Bearer {token}"}
-    )
+    response = client.get("/api/v1/current_user", headers=auth_headers)
 
     # 3. Verify response
     assert response.status_code == 200
@@ -198,7 +161,7 @@ def test_get_current_user_success():
     assert "hashed_password" not in data
 
 
-def test_get_current_user_invalid_token():
+def test_get_current_user_invalid_token(client):
     """Test with invalid token"""
     response = client.get(
         "/api/v1/current_user", headers={"Authorization": "Bearer invalidtoken123"}
@@ -207,22 +170,41 @@ def test_get_current_user_invalid_token():
     assert response.json()["detail"] == "Bad Token"
 
 
-def test_get_flights_unauthorized():
-    """Test unauthorized access to flights list"""
-    response = client.get("/api/v1/flights?page=1&size=10")
-    assert response.status_code == 401
-
-
-def test_get_flight_unauthorized():
-    """Test unauthorized access to single flight data"""
-    response = client.get(f"/api/v1/flights/{FLIGHT_NUMBER}")
+@pytest.mark.parametrize(
+    "method,url,json",
+    [
+        ("GET", "/api/v1/flights?page=1&size=10", None),
+        ("GET", f"/api/v1/flights/{FLIGHT_NUMBER}", None),
+        ("GET", "/api/v1/privilege", None),
+        (
+            "POST",
+            "/api/v1/tickets",
+            {
+                "flightNumber": FLIGHT_NUMBER,
+                "price": TICKET_PRICE,
+                "paidFromBalance": False,
+            },
+        ),
+        # Authorization is checked before the ticket is looked up
+        ("GET", "/api/v1/tickets/1", None),
+        ("GET", "/api/v1/me", None),
+        ("DELETE", "/api/v1/tickets/1", None),
+        (
+            "GET",
+            "/api/v1/routes/cheapest?from_airport=Пулково&to_airport=Шереметьево",
+            None,
+        ),
+    ],
+)
+def test_unauthorized(client, method, url, json):
+    """Test that protected endpoints reject requests without a token"""
+    response = client.request(method, url, json=json)
     assert response.status_code == 401
 
 
-def test_get_flights_authorized():
+def test_get_flights_authorized(client, auth_headers):
     """Test authorized access to flights list"""
-    headers = get_auth_headers()
-    response = client.get("/api/v1/flights?page=1&size=10", headers=headers)
+    response = client.get("/api/v1/flights?page=1&size=10", headers=auth_headers)
 
     assert response.status_code == 200
     assert "application/json" in response.headers["content-type"]
@@ -234,10 +216,16 @@ def test_get_flights_authorized():
     assert data["totalElements"] is not None
 
 
-def test_get_flight_authorized():
+@pytest.mark.parametrize("query", ["page=1&size=-2", "page=0&size=10"])
+def test_get_flights_bad_pagination(client, auth_headers, query):
+    """Test that invalid page or size values are rejected"""
+    response = client.get(f"/api/v1/flights?{query}", headers=auth_headers)
+    assert response.status_code == 400
+
+
+def test_get_flight_authorized(client, auth_headers):
     """Test authorized access to single flight data"""
-    headers = get_auth_headers()
-    response = client.get(f"/api/v1/flights/{FLIGHT_NUMBER}", headers=headers)
+    response = client.get(f"/api/v1/flights/{FLIGHT_NUMBER}", headers=auth_headers)
 
     assert response.status_code == 200
     assert "application/json" in response.headers["content-type"]
@@ -252,16 +240,9 @@ def test_get_flight_authorized():
     assert test_flight["price"] == TICKET_PRICE
 
 
-def test_get_privilege_unauthorized():
-    """Test unauthorized access to privilege info"""
-    response = client.get("/api/v1/privilege")
-    assert response.status_code == 401
-
-
-def test_get_privilege_authorized():
+def test_get_privilege_authorized(client, auth_headers):
     """Test authorized access to privilege info"""
-    headers = get_auth_headers()
-    response = client.get("/api/v1/privilege", headers=headers)
+    response = client.get("/api/v1/privilege", headers=auth_headers)
 
     assert response.status_code == 200
     assert "application/json" in response.headers["content-type"]
@@ -271,25 +252,29 @@ def test_get_privilege_authorized():
     assert data["status"] is not None
 
 
-def test_buy_ticket_unauthorized():
-    """Test unauthorized ticket purchase"""
-    response = client.post(
-        "/api/v1/tickets",
-        json={
-            "flightNumber": FLIGHT_NUMBER,
-            "price": TICKET_PRICE,
-            "paidFromBalance": False,
-        },
-    )
-    assert response.status_code == 401
+def test_get_privilege_paginated(client, auth_headers):
+    """Test paginated privilege history"""
+    response = client.get("/api/v1/privilege?page=1&size=1", headers=auth_headers)
 
+    assert response.status_code == 200
 
-def test_buy_ticket_authorized():
+    data = response.json()
+    assert len(data["history"]) <= 1
+    assert data["totalElements"] >= len(data["history"])
+
+
+@pytest.mark.parametrize("query", ["page=1&size=-2", "page=0&size=1"])
+def test_get_privilege_bad_pagination(client, auth_headers, query):
+    """Test that invalid page or size values are rejected"""
+    response = client.get(f"/api/v1/privilege?{query}", headers=auth_headers)
+    assert response.status_code == 400
+
+
+def test_buy_ticket_authorized(client, auth_headers):
     """Test authorized ticket purchase"""
-    headers = get_auth_headers()
     response = client.post(
         "/api/v1/tickets",
-        headers=headers,
+        headers=auth_headers,
         json={
             "flightNumber": FLIGHT_NUMBER,
             "bonus_amount": 0,
@@ -313,26 +298,65 @@ def test_buy_ticket_authorized():
     assert data["privilege"]["balance"] >= 150
     assert data["privilege"]["status"] is not None
 
-    # Save ticket ID for subsequent tests
-    pytest.ticket_id = data["ticket_id"]
 
+def test_buy_ticket_from_balance(client, auth_headers, db):
+    """Test that paying from balance never debits more than the price"""
+    balance = client.get("/api/v1/privilege", headers=auth_headers).json()["balance"]
 
-def test_get_ticket_unauthorized():
-    """Test unauthorized ticket info access"""
-    response = client.get(f"/api/v1/tickets/{pytest.ticket_id}")
-    assert response.status_code == 401
+    response = client.post(
+        "/api/v1/tickets",
+        headers=auth_headers,
+        json={
+            "flightNumber": FLIGHT_NUMBER,
+            "bonus_amount": TICKET_PRICE * 10,
+            "paidFromBalance": True,
+        },
+    )
+
+    assert response.status_code == 200
+
+    data = response.json()
+    assert data["price"] == TICKET_PRICE
+    assert data["paidByMoney"] >= 0
+    assert 0 <= data["paidByBonuses"] <= TICKET_PRICE
+    assert data["paidByMoney"] + data["paidByBonuses"] == TICKET_PRICE
+    assert data["paidByBonuses"] == min(balance, TICKET_PRICE)
+    assert data["privilege"]["balance"] == balance - data["paidByBonuses"]
+
+    response = client.get("/api/v1/privilege", headers=auth_headers)
+    assert response.json()["balance"] == balance - data["paidByBonuses"]
+
+
+@pytest.fixture
+def purchased_ticket(client, auth_headers):
+    """Buy a ticket for the test user and refund it after the test"""
+    response = client.post(
+        "/api/v1/tickets",
+        headers=auth_headers,
+        json={
+            "flightNumber": FLIGHT_NUMBER,
+            "bonus_amount": 0,
+            "paidFromBalance": False,
+        },
+    )
+    assert response.status_code == 200
+    ticket_id = response.json()["ticket_id"]
+
+    yield ticket_id
 
+    # Refunding an already refunded ticket is a no-op
+    client.delete(f"/api/v1/tickets/{ticket_id}", headers=auth_headers)
 
-def test_get_ticket_authorized():
+
+def test_get_ticket_authorized(client, auth_headers, purchased_ticket):
     """Test authorized ticket info access"""
-    headers = get_auth_headers()
-    response = client.get(f"/api/v1/tickets/{pytest.ticket_id}", headers=headers)
+    response = client.get(f"/api/v1/tickets/{purchased_ticket}", headers=auth_headers)
 
     assert response.status_code == 200
     assert "application/json" in response.headers["content-type"]
 
     data = response.json()
-    assert data["ticket_id"] == pytest.ticket_id
+    assert data["ticket_id"] == purchased_ticket
     assert data["flightNumber"] == FLIGHT_NUMBER
     assert data["fromAirport"] == "Санкт-Петербург Пулково"
     assert data["toAirport"] == "Москва Шереметьево"
@@ -341,16 +365,9 @@ def test_get_ticket_authorized():
     assert data["status"] == "PAID"
 
 
-def test_get_user_info_unauthorized():
-    """Test unauthorized user info access"""
-    response = client.get("/api/v1/me")
-    assert response.status_code == 401
-
-
-def test_get_user_info_authorized():
+def test_get_user_info_authorized(client, auth_headers, purchased_ticket):
     """Test authorized user info access"""
-    headers = get_auth_headers()
-    response = client.get("/api/v1/me", headers=headers)
+    response = client.get("/api/v1/me", headers=auth_headers)
 
     assert response.status_code == 200
     assert "application/json" in response.headers["content-type"]
@@ -358,7 +375,7 @@ def test_get_user_info_authorized():
     data = response.json()
     # Find our test ticket in user's tickets
     test_ticket = next(
-        (t for t in data["tickets"] if t["ticket_id"] == pytest.ticket_id), None
+        (t for t in data["tickets"] if t["ticket_id"] == purchased_ticket), None
     )
     assert test_ticket is not None
     assert test_ticket["flightNumber"] == FLIGHT_NUMBER
@@ -373,34 +390,19 @@ def test_get_user_info_authorized():
     assert data["privilege"]["status"] is not None
 
 
-def test_refund_ticket_unauthorized():
-    """Test unauthorized ticket refund"""
-    response = client.delete(f"/api/v1/tickets/{pytest.ticket_id}")
-    assert response.status_code == 401
-
-
-def test_refund_ticket_authorized():
+def test_refund_ticket_authorized(client, auth_headers, purchased_ticket):
     """Test authorized ticket refund"""
-    headers = get_auth_headers()
-    response = client.delete(f"/api/v1/tickets/{pytest.ticket_id}", headers=headers)
-    assert response.status_code == 204
-
-
-def test_find_cheapest_route_unauthorized():
-    """Test direct flight route"""
-    response = client.get(
-        "/api/v1/routes/cheapest?from_airport=Пулково&to_airport=Шереметьево",
+    response = client.delete(
+        f"/api/v1/tickets/{purchased_ticket}", headers=auth_headers
     )
-
-    assert response.status_code == 401
+    assert response.status_code == 204
 
 
-def test_find_cheapest_route_direct():
+def test_find_cheapest_route_direct(client, auth_headers):
     """Test direct flight route"""
-    headers = get_auth_headers()
     response = client.get(
         "/api/v1/routes/cheapest?from_airport=Пулково&to_airport=Домодедово",
-        headers=headers,
+        headers=auth_headers,
     )
 
     assert response.status_code == 200
@@ -410,12 +412,11 @@ def test_find_cheapest_route_direct():
     assert data["flights"][0]["flight_number"] == "AFL032"
 
 
-def test_find_cheapest_route_with_connection():
+def test_find_cheapest_route_with_connection(client, auth_headers):
     """Test multi-flight route with connection"""
-    headers = get_auth_headers()
     response = client.get(
         "/api/v1/routes/cheapest?from_airport=Пулково&to_airport=Шереметьево",
-        headers=headers,
+        headers=auth_headers,
     )
 
     assert response.status_code == 200
@@ -427,24 +428,22 @@ def test_find_cheapest_route_with_connection():
     assert data["total_price"] == 1200  # Sum of both flight prices
 
 
-def test_missing_airport():
+def test_missing_airport(client, auth_headers):
     """Test when departure airport doesn't exist"""
-    headers = get_auth_headers()
     response = client.get(
         "/api/v1/routes/cheapest?from_airport=Unknown&to_airport=Шереметьево",
-        headers=headers,
+        headers=auth_headers,
     )
 
     assert response.status_code == 404
     assert "not found" in response.json()["detail"].lower()
 
 
-def test_same_source_and_destination():
+def test_same_source_and_destination(client, auth_headers):
     """Test when from and to airports are the same"""
-    headers = get_auth_headers()
     response = client.get(
         "/api/v1/routes/cheapest?from_airport=Пулково&to_airport=Пулково",
-        headers=headers,
+        headers=auth_headers,
     )
 
     assert response.status_code == 200
@@ -1,10 +1,11 @@
 import random
 from datetime import datetime, timedelta
 
-from sqlmodel import Session, select
+from sqlalchemy import exists, insert, update
+from sqlmodel import Session, select, or_
 
 from ..app.db.session import engine, create_db_and_tables
-from ..app.db.users import User, UserCreate
+from ..app.db.users import User
 from ..app.db.flights import Flight, Airport
 from ..app.db.tickets import Ticket
 from ..app.db.bonuses import Privilege, PrivilegeHistory
@@ -12,183 +13,203 @@ from ..app.db.bonuses import Privilege, PrivilegeHistory
 
 def database_has_data(session: Session) -> bool:
     """Check if database already contains test data"""
-    # Check for any existing users
-    existing_users = session.exec(select(User)).first()
-    if existing_users:
-        return True
-
-    # Check for any existing flights
-    existing_flights = session.exec(select(Flight)).first()
-    if existing_flights:
-        return True
-
-    # Check for any existing tickets
-    existing_tickets = session.exec(select(Ticket)).first()
-    if existing_tickets:
-        return True
-
-    return False
-
-
-def create_test_users(session: Session):
+    # Any existing users, flights or tickets, checked in one query
+    return session.exec(
+        select(
+            or_(
+                exists().where(User.id.is_not(None)),
+                exists().where(Flight.id.is_not(None)),
+                exists().where(Ticket.id.is_not(None)),
+            )
+        )
+    ).one()
+
+
+# Precomputed bcrypt hashes (10 rounds) of the test passwords, so seeding
+# does not pay for hashing: testpassword, admin123, travel123
+TEST_USERS = [
+    {
+        "login": "testuser",
+        "email": "test@example.com",
+        "hashed_password": "$2b$10$ycjZCi94ImbEqCLfJk8gzuVYqFBcjioCSpilGKQnvHCf3kSzKhEmK",
+    },
+    {
+        "login": "admin",
+        "email": "admin@example.com",
+        "hashed_password": "$2b$10$uSkz1yP1ZQ6/pfC6wvE2JuWnoBaCzaJ0V4qepBmcYBgRB.wJvavDS",
+    },
+    {
+        "login": "traveler",
+        "email": "traveler@example.com",
+        "hashed_password": "$2b$10$uC3arlCNM.AnMbHBl5uKD.M.I5bhJC.y2ZkiiJuRmmwIF1TuBXm3e",
+    },
+]
+
+
+def insert_returning_ids(session: Session, model, rows: list[dict]) -> list[int]:
+    """Insert rows in one executemany and return their ids in the same order"""
+    return session.exec(
+        insert(model).returning(model.id, sort_by_parameter_order=True),
+        params=rows,
+    ).scalars().all()
+
+
+def create_test_users(session: Session) -> list[int]:
     """Create test user accounts"""
-    users_data = [
-        UserCreate(login="testuser", email="test@example.com", password="testpassword"),
-        UserCreate(login="admin", email="admin@example.com", password="admin123"),
-        UserCreate(
-            login="traveler", email="traveler@example.com", password="travel123"
-        ),
-    ]
-
-    for user_data in users_data:
-        user = user_data.create_hashed()
-        session.add(user)
-
-    session.commit()
+    user_ids = insert_returning_ids(session, User, TEST_USERS)
     print("Created test users")
+    return user_ids
 
 
-def create_test_airports(session: Session):
+def create_test_airports(session: Session) -> dict[str, int]:
     """Create test airports"""
     airports = [
-        Airport(name="Пулково", city="Санкт-Петербург", country="Россия"),
-        Airport(name="Шереметьево", city="Москва", country="Россия"),
-        Airport(name="Домодедово", city="Москва", country="Россия"),
-        Airport(name="Внуково", city="Москва", country="Россия"),
-        Airport(name="Кольцово", city="Екатеринбург", country="Россия"),
+        {"name": "Пулково", "city": "Санкт-Петербург", "country": "Россия"},
+        {"name": "Шереметьево", "city": "Москва", "country": "Россия"},
+        {"name": "Домодедово", "city": "Москва", "country": "Россия"},
+        {"name": "Внуково", "city": "Москва", "country": "Россия"},
+        {"name": "Кольцово", "city": "Екатеринбург", "country": "Россия"},
     ]
 
-    for airport in airports:
-        session.add(airport)
-
-    session.commit()
+    ids = insert_returning_ids(session, Airport, airports)
     print("Created test airports")
+    return {airport["name"]: airport_id for airport, airport_id in zip(airports, ids)}
 
 
-def create_test_flights(session: Session):
+def create_test_flights(session: Session, airports: dict[str, int]) -> list[dict]:
     """Create test flights"""
-    # Get airports
-    airports = session.exec(select(Airport)).all()
+    airport_ids = list(airports.values())
+    airport_count = len(airport_ids)
+    now = datetime.now()
 
     flights = []
     for i in range(1, 21):
-        from_airport = random.choice(airports)
-        to_airport = random.choice([a for a in airports if a.id != from_airport.id])
+        # Pick two different airports by index, skipping over the departure
+        # one instead of filtering the list on every iteration
+        from_idx = random.randrange(airport_count)
+        to_idx = random.randrange(airport_count - 1)
+        to_idx += to_idx >= from_idx
 
-        flight_date = datetime.now() + timedelta(days=random.randint(1, 30))
+        flight_date = now + timedelta(days=random.randint(1, 30))
 
         flights.append(
-            Flight(
-                flight_number=f"AFL{str(i).zfill(3)}",
-                datetime=flight_date,
-                from_airport_id=from_airport.id,
-                to_airport_id=to_airport.id,
-                price=random.randint(1000, 5000),
-            )
+            {
+                "flight_number": f"AFL{str(i).zfill(3)}",
+                "datetime": flight_date,
+                "from_airport_id": airport_ids[from_idx],
+                "to_airport_id": airport_ids[to_idx],
+                "price": random.randint(1000, 5000),
+            }
         )
 
     # Add specific test flight
-    pulkovo = session.exec(select(Airport).where(Airport.name == "Пулково")).first()
-    sheremetyevo = session.exec(
-        select(Airport).where(Airport.name == "Шереметьево")
-    ).first()
-    domodedovo = session.exec(select(Airport).where(Airport.name == "Домодедово")).first()
+    test_flight_date = now + timedelta(days=7)
+    pulkovo = airports["Пулково"]
+    sheremetyevo = airports["Шереметьево"]
+    domodedovo = airports["Домодедово"]
 
     flights.append(
-        Flight(
-            flight_number="AFL031",
-            datetime=datetime.now() + timedelta(days=7),
-            from_airport_id=pulkovo.id,
-            to_airport_id=sheremetyevo.id,
-            price=1500,
-        )
+        {
+            "flight_number": "AFL031",
+            "datetime": test_flight_date,
+            "from_airport_id": pulkovo,
+            "to_airport_id": sheremetyevo,
+            "price": 1500,
+        }
     )
 
     flights.append(
-        Flight(
-            flight_number="AFL032",
-            datetime=datetime.now() + timedelta(days=7),
-            from_airport_id=pulkovo.id,
-            to_airport_id=domodedovo.id,
-            price=500,
-        )
+        {
+            "flight_number": "AFL032",
+            "datetime": test_flight_date,
+            "from_airport_id": pulkovo,
+            "to_airport_id": domodedovo,
+            "price": 500,
+        }
     )
 
     flights.append(
-        Flight(
-            flight_number="AFL033",
-            datetime=datetime.now() + timedelta(days=7),
-            from_airport_id=domodedovo.id,
-            to_airport_id=sheremetyevo.id,
-            price=700,
-        )
+        {
+            "flight_number": "AFL033",
+            "datetime": test_flight_date,
+            "from_airport_id": domodedovo,
+            "to_airport_id": sheremetyevo,
+            "price": 700,
+        }
     )
 
-    for flight in flights:
-        session.add(flight)
-
-    session.commit()
+    ids = insert_returning_ids(session, Flight, flights)
+    for flight, flight_id in zip(flights, ids):
+        flight["id"] = flight_id
     print("Created test flights")
+    return flights
 
 
-def create_test_privileges(session: Session):
+def create_test_privileges(session: Session, user_ids: list[int]) -> list[dict]:
     """Create test privilege accounts"""
-    users = session.exec(select(User)).all()
     statuses = ["BRONZE", "SILVER", "GOLD"]
 
-    for user in users:
-        privilege = Privilege(
-            user_id=user.id,
-            status=random.choice(statuses),
-            balance=random.randint(0, 5000),
-        )
-        session.add(privilege)
-
-    session.commit()
+    privileges = [
+        {
+            "user_id": user_id,
+            "status": random.choice(statuses),
+            "balance": random.randint(0, 5000),
+        }
+        for user_id in user_ids
+    ]
+    ids = insert_returning_ids(session, Privilege, privileges)
+    for privilege, privilege_id in zip(privileges, ids):
+        privilege["id"] = privilege_id
     print("Created test privileges")
+    return privileges
 
 
-def create_test_tickets(session: Session):
-    """Create test tickets if they don't exist"""
-    users = session.exec(select(User)).all()
-    flights = session.exec(select(Flight)).all()
-    privileges = session.exec(select(Privilege)).all()
-
-    existing_ticket = session.exec(select(Ticket)).first()
-    if existing_ticket:
-        return
-
-    for user, privilege in zip(users, privileges):
+def create_test_tickets(session: Session, privileges: list[dict], flights: list[dict]):
+    """Create test tickets for every user that has a privilege account"""
+    tickets = []
+    ticket_privileges = []
+    for privilege in privileges:
         for _ in range(random.randint(1, 3)):
             flight = random.choice(flights)
-
-            # First create and commit the ticket to get an ID
-            ticket = Ticket(
-                user_id=user.id,
-                flight_id=flight.id,
-                price=flight.price,
-                status="PAID",
+            tickets.append(
+                {
+                    "user_id": privilege["user_id"],
+                    "flight_id": flight["id"],
+                    "price": flight["price"],
+                    "status": "PAID",
+                }
             )
-            session.add(ticket)
-            session.commit()  # Commit to get the ticket.id
-            session.refresh(ticket)  # Refresh to populate the ID
-
-            # Now create the privilege history with the ticket ID
-            bonus = int(flight.price * 0.1)  # 10% of ticket price as bonus
-            history = PrivilegeHistory(
-                privilege_id=privilege.id,
-                ticket_id=ticket.id,  # Now we have a valid ticket.id
-                datetime=datetime.now(),
-                balance_diff=bonus,
-                operation_type="FILL_IN_BALANCE",
-            )
-            session.add(history)
-
-            # Update privilege balance
-            privilege.balance += bonus
-            session.add(privilege)
-
-    session.commit()
+            ticket_privileges.append(privilege["id"])
+
+    # One executemany inserts every ticket, RETURNING gives their ids in order
+    ticket_ids = insert_returning_ids(session, Ticket, tickets)
+
+    balances = {privilege["id"]: privilege["balance"] for privilege in privileges}
+    now = datetime.now()
+    histories = []
+    for privilege_id, ticket, ticket_id in zip(ticket_privileges, tickets, ticket_ids):
+        bonus = int(ticket["price"] * 0.1)  # 10% of ticket price as bonus
+        histories.append(
+            {
+                "privilege_id": privilege_id,
+                "ticket_id": ticket_id,
+                "datetime": now,
+                "balance_diff": bonus,
+                "operation_type": "FILL_IN_BALANCE",
+            }
+        )
+        # Update privilege balance
+        balances[privilege_id] += bonus
+
+    session.exec(insert(PrivilegeHistory), params=histories)
+    # Bulk UPDATE by primary key
+    session.exec(
+        update(Privilege),
+        params=[
+            {"id": privilege_id, "balance": balance}
+            for privilege_id, balance in balances.items()
+        ],
+    )
     print("Created test tickets")
 
 
@@ -201,8 +222,15 @@ def fill_test_db():
         if database_has_data(session):
             return
 
-        create_test_users(session)
-        create_test_airports(session)
-        create_test_flights(session)
-        create_test_privileges(session)
-        create_test_tickets(session)
+        # Fixed seed, so every run gets the same flights, prices and tickets
+        random.seed(0)
+
+        # Inserted rows are passed on instead of being selected again
+        user_ids = create_test_users(session)
+        airports = create_test_airports(session)
+        flights = create_test_flights(session, airports)
+        privileges = create_test_privileges(session, user_ids)
+        create_test_tickets(session, privileges, flights)
+
+        # All test data is written in one transaction
+        session.commit()